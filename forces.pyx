@@ -0,0 +1,84 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# Physics step for image-network-visualization.py when Numba isn't
+# installed. Build with `python setup.py build_ext --inplace`.
+from libc.math cimport sqrt
+import numpy as np
+
+def step(float[::1] px, float[::1] py, float[::1] vx, float[::1] vy,
+         const unsigned char[::1] anchored, const int[::1] rowptr, const int[::1] colids,
+         float spring_length, float spring_strength, float repulsion, float cutoff2,
+         float damping, float max_velocity, float width, float height, float padding):
+    # Same step as the Numba kernels: forces are gathered for every node
+    # before any position moves, then integrated
+    cdef Py_ssize_t n = px.shape[0]
+    cdef Py_ssize_t i, j, k
+    cdef float[::1] fx = np.zeros(n, dtype=np.float32)
+    cdef float[::1] fy = np.zeros(n, dtype=np.float32)
+    cdef float xi, yi, dx, dy, d2, inv_d, force, ax, ay
+    cdef float nvx, nvy, speed2, limit, x, y
+    cdef bint bounce_x, bounce_y
+
+    for i in range(n):
+        if anchored[i]:
+            continue
+        xi = px[i]
+        yi = py[i]
+        ax = 0
+        ay = 0
+        for j in range(n):
+            dx = px[j] - xi
+            dy = py[j] - yi
+            d2 = dx * dx + dy * dy
+            # Pairs closer than a pixel (including the node itself) or
+            # beyond the cutoff don't repel
+            if d2 < 1 or d2 > cutoff2:
+                continue
+            inv_d = 1 / sqrt(d2)
+            force = repulsion * inv_d * inv_d * inv_d
+            ax -= dx * force
+            ay -= dy * force
+        for k in range(rowptr[i], rowptr[i + 1]):
+            j = colids[k]
+            dx = px[j] - xi
+            dy = py[j] - yi
+            d2 = dx * dx + dy * dy
+            if d2 == 0:
+                continue
+            inv_d = 1 / sqrt(d2)
+            force = (d2 * inv_d - spring_length) * spring_strength * inv_d
+            ax += dx * force
+            ay += dy * force
+        fx[i] = ax
+        fy[i] = ay
+
+    for i in range(n):
+        if anchored[i]:
+            continue
+        nvx = (vx[i] + fx[i]) * damping
+        nvy = (vy[i] + fy[i]) * damping
+        speed2 = nvx * nvx + nvy * nvy
+        if speed2 > max_velocity * max_velocity:
+            limit = max_velocity / sqrt(speed2)
+            nvx = nvx * limit
+            nvy = nvy * limit
+        # Bounce off the walls, losing half the speed
+        x = px[i] + nvx
+        y = py[i] + nvy
+        bounce_x = x < padding or x > width - padding
+        bounce_y = y < padding or y > height - padding
+        if x < padding:
+            x = padding
+        elif x > width - padding:
+            x = width - padding
+        if y < padding:
+            y = padding
+        elif y > height - padding:
+            y = height - padding
+        if bounce_x:
+            nvx = nvx * -0.5
+        if bounce_y:
+            nvy = nvy * -0.5
+        px[i] = x
+        py[i] = y
+        vx[i] = nvx
+        vy[i] = nvy
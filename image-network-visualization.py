@@ -1,58 +1,556 @@
+import os
+# Use SDL's SIMD alpha blitters rather than pygame's own
+os.environ.setdefault("PYGAME_BLEND_ALPHA_SDL2", "1")
 import pygame
-import math
 import random
-import os
 import json
-from PIL import Image
+import sys
+import types
+import weakref
+import functools
+import numpy as np
+
+try:
+    from pygame._sdl2.video import Window, Renderer, Texture
+    from pygame._sdl2.video import error as RendererError
+except ImportError:  # Without it only the software renderer is available
+    Window = Renderer = Texture = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional, apply_forces falls back to NumPy
+    njit = prange = None
+
+try:
+    import forces
+except ImportError:  # Cython build of the step (setup.py), used without Numba
+    forces = None
+
+def display_format(surface):
+    # Match the display surface's pixel format so blits don't convert. The
+    # GPU renderer has no display surface, so just make sure of an alpha channel
+    if pygame.display.get_surface() is None:
+        if surface.get_flags() & pygame.SRCALPHA:
+            return surface
+        converted = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        converted.blit(surface, (0, 0))
+        return converted
+    return surface.convert_alpha()
+
+@functools.lru_cache(maxsize=None)
+def circle_sprite(radius, color, width=0):
+    # Prerendered circle centred at (radius, radius), filled when width is 0.
+    # Shared by every node drawn at that radius.
+    surface = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+    pygame.draw.circle(surface, color, (radius, radius), radius, width)
+    return display_format(surface)
+
+def merge_rects(rects):
+    # Union overlapping rects so each area of the screen is repainted once
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+def edge_paths(node_count, edges):
+    # Split the graph's edges into paths, each edge on exactly one, so a
+    # chain of connected nodes is drawn with one pygame.draw.lines call.
+    # Paths start at odd-degree nodes first since those are path ends.
+    remaining = [set() for _ in range(node_count)]
+    for i, j in edges:
+        remaining[i].add(j)
+        remaining[j].add(i)
+    paths = []
+    for start in sorted(range(len(remaining)), key=lambda i: len(remaining[i]) % 2 == 0):
+        while remaining[start]:
+            path = [start]
+            node = start
+            while remaining[node]:
+                next_node = remaining[node].pop()
+                remaining[next_node].discard(node)
+                path.append(next_node)
+                node = next_node
+            paths.append(path)
+    return paths
+
+def segment_rect(segment):
+    # Area covered by an edge drawn 2 pixels wide
+    (x1, y1), (x2, y2) = segment
+    return pygame.Rect(min(x1, x2) - 2, min(y1, y2) - 2, abs(x2 - x1) + 5, abs(y2 - y1) + 5)
+
+class LoadedImage:
+    # A decoded image and the sprites rendered from it, shared by every node
+    # showing that image (dropping a file twice, or reloading a saved graph)
+    def __init__(self, image_path):
+        self.original = display_format(pygame.image.load(image_path))
+        self.sprites = {}
 
 class ImageNode:
-    def __init__(self, image_path, x, y):
+    background_color = (240, 240, 240)
+    anchor_color = (0, 120, 255)
+    select_color = (0, 255, 0)
+    base_radius = 30
+    # LoadedImage per image path. Only the nodes keep them alive, so an image
+    # and its sprites (and their textures) are freed with its last node.
+    _loaded = weakref.WeakValueDictionary()
+
+    def __init__(self, image_path, network, index):
         self.image_path = image_path
-        self.x = x
-        self.y = y
-        self.vx = 0
-        self.vy = 0
-        self.connections = set()
-        self.anchored = False
-        self.base_radius = 30
+        # Position, velocity, anchoring and connections live in the
+        # visualizer's arrays; `index` is this node's slot in them
+        self.network = network
+        self.index = index
         self.radius = self.base_radius
-        self.hover_scale = 1.0
         
-        # Load and scale the image
-        self.original_image = Image.open(image_path)
-        self.update_image()
+        # Load the image, and render its sprites up front for both the sizes
+        # it's drawn at (ending at normal size) so hovering never rescales
+        loaded = self._loaded.get(image_path)
+        if loaded is None:
+            loaded = self._loaded[image_path] = LoadedImage(image_path)
+        self._shared = loaded
+        self.original_image, self._sprites = loaded.original, loaded.sprites
+        for scale in (network.hover_scale, 1.0):
+            self.hover_scale = scale
+            self.update_image()
+
+    def render_image(self, radius):
+        # Shrink to fit the circle's bounding box, keeping the aspect ratio.
+        # The original is already in the display's pixel format, so blits
+        # don't convert every pixel on the fly
+        width, height = self.original_image.get_size()
+        scale = min(1.0, int(radius * 2) / width, int(radius * 2) / height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if size == (width, height):
+            image = self.original_image.copy()
+        else:
+            image = pygame.transform.smoothscale(self.original_image, size)
+        # The circular mask covers the whole image and is shared by every
+        # node of the same size
+        mask = circle_sprite(int(radius), (255, 255, 255, 255))
+        image.blit(mask, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+        if self.network.renderer:
+            # Textures are drawn with plain alpha blending
+            return image
+        # The mask is baked into the alpha now, so premultiply once and draw
+        # with BLEND_PREMULTIPLIED. pygame-ce can do it without another copy.
+        if hasattr(image, "premul_alpha_ip"):
+            image.premul_alpha_ip()
+            return image
+        return image.premul_alpha()
 
     def update_image(self):
-        current_size = (int(self.radius * 2), int(self.radius * 2))
-        temp_image = self.original_image.copy()
-        temp_image.thumbnail(current_size, Image.Resampling.LANCZOS)
-        mode = temp_image.mode
-        size = temp_image.size
-        data = temp_image.tobytes()
-        self.image = pygame.image.fromstring(data, size, mode)
-        self.mask = pygame.Surface(self.image.get_size(), pygame.SRCALPHA)
-        pygame.draw.circle(self.mask, (255, 255, 255, 255), (int(self.radius), int(self.radius)), int(self.radius))
-        self.image.blit(self.mask, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+        # Everything drawn for the node at a scale is rendered once and kept
+        sprites = self._sprites.get(self.hover_scale)
+        if sprites is None:
+            radius = self.base_radius * self.hover_scale
+            sprites = self._sprites[self.hover_scale] = (
+                self.render_image(radius),
+                circle_sprite(int(radius), self.background_color),
+                circle_sprite(int(radius) + 2, self.anchor_color, 3),
+                circle_sprite(int(radius) + 2, self.select_color, 2))
+            if self.network.renderer:
+                # Upload now rather than in the middle of a frame
+                for surface in sprites:
+                    self.network.texture(surface)
+        self.image, self.bg_surf, self.anchor_ring, self.select_ring = sprites
+        # Offsets from the centre to the image's top left, used every frame
+        self._half_w = self.image.get_width() // 2
+        self._half_h = self.image.get_height() // 2
+
+    @property
+    def x(self):
+        return float(self.network.px[self.index])
+
+    @x.setter
+    def x(self, value):
+        self.network.move_node(self.index, value, self.network.py[self.index])
+
+    @property
+    def y(self):
+        return float(self.network.py[self.index])
+
+    @y.setter
+    def y(self, value):
+        self.network.move_node(self.index, self.network.px[self.index], value)
+
+    @property
+    def vx(self):
+        return float(self.network.vx[self.index])
+
+    @vx.setter
+    def vx(self, value):
+        self.network.vx[self.index] = value
+
+    @property
+    def vy(self):
+        return float(self.network.vy[self.index])
+
+    @vy.setter
+    def vy(self, value):
+        self.network.vy[self.index] = value
+
+    @property
+    def anchored(self):
+        return bool(self.network.anchored[self.index])
+
+    @anchored.setter
+    def anchored(self, value):
+        self.network.anchored[self.index] = value
+        self.network.wake()
 
     def set_hover_scale(self, scale):
         if self.hover_scale != scale:
             self.hover_scale = scale
             self.radius = self.base_radius * scale
             self.update_image()
+            self.network.radii[self.index] = int(self.radius)
+
+def spread_bits(v):
+    # Interleave zeros between the low 16 bits of v (for Morton codes)
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+class QuadTree:
+    # Barnes-Hut quadtree over node positions, stored as flat arrays. Nodes
+    # are sorted by Morton code so that each cell of a level is a contiguous
+    # run of nodes, and the children of a cell are contiguous on the next level.
+    max_depth = 12
+
+    def __init__(self, px, py):
+        n = len(px)
+        depth = self.max_depth
+        x0, y0 = float(px.min()), float(py.min())
+        size = max(float(px.max()) - x0, float(py.max()) - y0, 1.0)
+        cells = 1 << depth
+        qx = np.minimum(((px - x0) * (cells / size)).astype(np.int64), cells - 1)
+        qy = np.minimum(((py - y0) * (cells / size)).astype(np.int64), cells - 1)
+        self.codes = spread_bits(qx) | (spread_bits(qy) << 1)
+
+        order = np.argsort(self.codes, kind="stable")
+        sorted_codes = self.codes[order]
+        sorted_x = px[order].astype(np.float64)
+        sorted_y = py[order].astype(np.float64)
+
+        prefix, shift, count, cx, cy, half_size, first_child = [], [], [], [], [], [], []
+        offset = 0
+        for level in range(depth + 1):
+            level_shift = 2 * (depth - level)
+            codes = sorted_codes >> level_shift
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            level_count = np.diff(np.r_[starts, n])
+            prefix.append(codes[starts])
+            shift.append(np.full(len(starts), level_shift))
+            count.append(level_count)
+            cx.append(np.add.reduceat(sorted_x, starts) / level_count)
+            cy.append(np.add.reduceat(sorted_y, starts) / level_count)
+            half_size.append(np.full(len(starts), size / (2 << level)))
+            if level:
+                # Link the previous level's cells to their first child
+                parents = prefix[-1] >> 2
+                first_child[-1] = offset + np.searchsorted(parents, prefix[-2])
+            first_child.append(np.zeros(len(starts), dtype=np.int64))
+            offset += len(starts)
+
+        self.prefix = np.concatenate(prefix)
+        self.shift = np.concatenate(shift)
+        self.count = np.concatenate(count)
+        self.cx = np.concatenate(cx)
+        self.cy = np.concatenate(cy)
+        self.half_size = np.concatenate(half_size)
+        self.first_child = np.concatenate(first_child)
+        # Children are contiguous, so a cell's range ends where the next starts
+        self.child_count = np.zeros(offset, dtype=np.int64)
+        internal = offset - len(prefix[-1])
+        ends = np.r_[self.first_child[1:internal], offset]
+        self.child_count[:internal] = ends - self.first_child[:internal]
+
+    def repulsion(self, px, py, strength, theta, cutoff2):
+        # Inverse-square repulsion on every node. A cell that doesn't contain
+        # the node and whose size/distance is below theta acts as a single
+        # point at its centroid; otherwise its children are visited.
+        if njit is not None:
+            return _tree_repulsion(px, py, self.codes, self.prefix, self.shift, self.count,
+                                   self.cx, self.cy, self.half_size, self.first_child,
+                                   self.child_count, self.max_depth, strength, theta, cutoff2)
+        # Without Numba, every node walks the tree at once, a level per pass
+        n = len(px)
+        fx = np.zeros(n, dtype=np.float64)
+        fy = np.zeros(n, dtype=np.float64)
+        body = np.arange(n)
+        cell = np.zeros(n, dtype=np.int64)
+        while len(body):
+            dx = self.cx[cell] - px[body]
+            dy = self.cy[cell] - py[body]
+            d2 = dx * dx + dy * dy
+            size = 2 * self.half_size[cell]
+            contains = (self.codes[body] >> self.shift[cell]) == self.prefix[cell]
+            single = self.count[cell] == 1
+            leaf = self.child_count[cell] == 0
+            accept = ~contains & (single | leaf | (size * size < theta * theta * d2))
+
+            # Pairs closer than a pixel or beyond the cutoff don't repel
+            near = accept & (d2 >= 1.0) & (d2 <= cutoff2)
+            d2 = d2[near]
+            push = strength * self.count[cell[near]] / d2 / np.sqrt(d2)
+            fx -= np.bincount(body[near], weights=dx[near] * push, minlength=n)
+            fy -= np.bincount(body[near], weights=dy[near] * push, minlength=n)
+
+            # Replace each opened cell with its children
+            opened = ~accept & ~single & ~leaf
+            body, cell = body[opened], cell[opened]
+            children = self.child_count[cell]
+            first = np.repeat(self.first_child[cell], children)
+            run_start = np.repeat(np.cumsum(children) - children, children)
+            body = np.repeat(body, children)
+            cell = first + np.arange(len(first)) - run_start
+        return fx.astype(np.float32), fy.astype(np.float32)
+
+def _tree_repulsion(px, py, codes, prefix, shift, count, cx, cy, half_size, first_child,
+                    child_count, max_depth, strength, theta, cutoff2):
+    # Compiled QuadTree.repulsion: each node walks the tree depth first with
+    # its own stack. A cell pushes at most 4 children and the walk goes at
+    # most max_depth levels down, which bounds the stack.
+    n = px.shape[0]
+    fx = np.zeros(n, dtype=np.float32)
+    fy = np.zeros(n, dtype=np.float32)
+    theta2 = theta * theta
+    for i in prange(n):
+        stack = np.empty(4 * (max_depth + 1), dtype=np.int64)
+        stack[0] = 0
+        top = 1
+        xi = px[i]
+        yi = py[i]
+        code = codes[i]
+        ax = 0.0
+        ay = 0.0
+        while top:
+            top -= 1
+            cell = stack[top]
+            dx = cx[cell] - xi
+            dy = cy[cell] - yi
+            d2 = dx * dx + dy * dy
+            size = 2 * half_size[cell]
+            contains = (code >> shift[cell]) == prefix[cell]
+            single = count[cell] == 1
+            leaf = child_count[cell] == 0
+            if not contains and (single or leaf or size * size < theta2 * d2):
+                # Pairs closer than a pixel or beyond the cutoff don't repel
+                if d2 >= 1.0 and d2 <= cutoff2:
+                    inv_d = 1.0 / np.sqrt(d2)
+                    push = strength * count[cell] * inv_d * inv_d * inv_d
+                    ax -= dx * push
+                    ay -= dy * push
+            elif not single and not leaf:
+                for child in range(first_child[cell], first_child[cell] + child_count[cell]):
+                    stack[top] = child
+                    top += 1
+        fx[i] = ax
+        fy[i] = ay
+    return fx, fy
+
+def _integrate(px, py, vx, vy, anchored, fx, fy, damping, max_velocity, width, height, padding):
+    # The kernels take float32 scalars and use float32 constants, so the
+    # arithmetic never widens to float64 and fastmath can use approximate
+    # reciprocal square roots
+    for i in range(px.shape[0]):
+        if anchored[i]:
+            continue
+        nvx = (vx[i] + fx[i]) * damping
+        nvy = (vy[i] + fy[i]) * damping
+        # Compare squared speeds; only nodes over the limit need the root
+        speed2 = nvx * nvx + nvy * nvy
+        if speed2 > max_velocity * max_velocity:
+            limit = max_velocity / np.sqrt(speed2)
+            nvx = nvx * limit
+            nvy = nvy * limit
+        # Bounce off the walls, losing half the speed. Written as selects
+        # rather than branches so the loop vectorizes.
+        x = px[i] + nvx
+        y = py[i] + nvy
+        low_x = x < padding
+        high_x = x > width - padding
+        low_y = y < padding
+        high_y = y > height - padding
+        x = padding if low_x else (width - padding if high_x else x)
+        y = padding if low_y else (height - padding if high_y else y)
+        nvx = nvx * np.float32(-0.5) if low_x | high_x else nvx
+        nvy = nvy * np.float32(-0.5) if low_y | high_y else nvy
+        px[i] = x
+        py[i] = y
+        vx[i] = nvx
+        vy[i] = nvy
+
+def _step(px, py, vx, vy, anchored, rowptr, colids, spring_length, spring_strength,
+          repulsion, cutoff2, damping, max_velocity, width, height, padding):
+    # Compiled equivalent of NetworkVisualizer.step_physics. Forces are
+    # gathered for every node before any position moves, then integrated.
+    n = px.shape[0]
+    fx = np.zeros(n, dtype=np.float32)
+    fy = np.zeros(n, dtype=np.float32)
+    for i in prange(n):
+        if anchored[i]:
+            continue
+        xi = px[i]
+        yi = py[i]
+        ax = np.float32(0.0)
+        ay = np.float32(0.0)
+        for j in range(n):
+            dx = px[j] - xi
+            dy = py[j] - yi
+            d2 = dx * dx + dy * dy
+            if d2 < 1.0 or d2 > cutoff2:
+                continue
+            # One division per pair instead of two
+            inv_d = np.float32(1.0) / np.sqrt(d2)
+            force = repulsion * inv_d * inv_d * inv_d
+            ax -= dx * force
+            ay -= dy * force
+        for k in range(rowptr[i], rowptr[i + 1]):
+            j = colids[k]
+            dx = px[j] - xi
+            dy = py[j] - yi
+            d2 = dx * dx + dy * dy
+            if d2 == 0.0:
+                continue
+            inv_d = np.float32(1.0) / np.sqrt(d2)
+            force = (d2 * inv_d - spring_length) * spring_strength * inv_d
+            ax += dx * force
+            ay += dy * force
+        fx[i] = ax
+        fy[i] = ay
+    _integrate(px, py, vx, vy, anchored, fx, fy, damping, max_velocity, width, height, padding)
+
+def _step_springs(px, py, vx, vy, anchored, rowptr, colids, fx, fy, spring_length,
+                  spring_strength, damping, max_velocity, width, height, padding):
+    # Step for graphs whose repulsion comes from the quadtree: adds the
+    # springs to the given forces, then integrates
+    for i in prange(px.shape[0]):
+        if anchored[i]:
+            continue
+        for k in range(rowptr[i], rowptr[i + 1]):
+            j = colids[k]
+            dx = px[j] - px[i]
+            dy = py[j] - py[i]
+            d2 = dx * dx + dy * dy
+            if d2 == 0.0:
+                continue
+            inv_d = np.float32(1.0) / np.sqrt(d2)
+            force = (d2 * inv_d - spring_length) * spring_strength * inv_d
+            fx[i] += dx * force
+            fy[i] += dy * force
+    _integrate(px, py, vx, vy, anchored, fx, fy, damping, max_velocity, width, height, padding)
+
+def _step_dense(px, py, vx, vy, anchored, adjacency, spring_length, spring_strength,
+                repulsion, cutoff2, damping, max_velocity, width, height, padding):
+    # Same step for tiny graphs: springs come from a dense adjacency matrix,
+    # so repulsion and springs share one pass over the pairs
+    n = px.shape[0]
+    fx = np.zeros(n, dtype=np.float32)
+    fy = np.zeros(n, dtype=np.float32)
+    for i in range(n):
+        if anchored[i]:
+            continue
+        ax = np.float32(0.0)
+        ay = np.float32(0.0)
+        for j in range(n):
+            dx = px[j] - px[i]
+            dy = py[j] - py[i]
+            d2 = dx * dx + dy * dy
+            if d2 == 0.0:
+                continue
+            inv_d = np.float32(1.0) / np.sqrt(d2)
+            force = np.float32(0.0)
+            if d2 >= 1.0 and d2 <= cutoff2:
+                force -= repulsion * inv_d * inv_d * inv_d
+            if adjacency[i, j]:
+                force += (d2 * inv_d - spring_length) * spring_strength * inv_d
+            ax += dx * force
+            ay += dy * force
+        fx[i] = ax
+        fy[i] = ay
+    _integrate(px, py, vx, vy, anchored, fx, fy, damping, max_velocity, width, height, padding)
+
+# Graphs below these sizes use the dense and the single-threaded kernels
+TINY_GRAPH = 16
+SMALL_GRAPH = 256
+
+def _specialize(func, name, **options):
+    # Compile a copy of func under its own name, so that variants compiled
+    # with different options get separate entries in Numba's disk cache
+    copy = types.FunctionType(func.__code__, func.__globals__, name, func.__defaults__)
+    copy.__qualname__ = name
+    return njit(cache=True, fastmath=True, boundscheck=False, **options)(copy)
+
+@functools.lru_cache(maxsize=None)
+def step_kernel(size_class):
+    # Threads only pay off once there are enough pairs to split between them
+    if size_class == "tiny":
+        return _specialize(_step_dense, "_step_tiny")
+    if size_class == "small":
+        return _specialize(_step, "_step_small")
+    return _specialize(_step, "_step_large", parallel=True)
+
+if njit is not None:
+    _integrate = njit(cache=True, fastmath=True, boundscheck=False)(_integrate)
+    _tree_repulsion = njit(cache=True, fastmath=True, boundscheck=False, parallel=True)(_tree_repulsion)
+    _step_springs = njit(cache=True, fastmath=True, boundscheck=False, parallel=True)(_step_springs)
 
 class NetworkVisualizer:
-    def __init__(self, width=1000, height=1000, save_file="network_state.json"):
+    # Per-node state, one array per field (indexed by ImageNode.index). Each
+    # is a view of the first len(nodes) slots of a buffer that doubles in
+    # size when it fills up.
+    state_arrays = {
+        "px": np.float32,
+        "py": np.float32,
+        "vx": np.float32,
+        "vy": np.float32,
+        "radii": np.int16,
+        "anchored": np.bool_,
+    }
+
+    def __init__(self, width=1000, height=1000, save_file="network_state.json", use_gpu=False):
         pygame.init()
         self.width = width
         self.height = height
         self.save_file = save_file
         
-        # Initialize pygame display
-        self.screen = pygame.display.set_mode((width, height), pygame.RESIZABLE | pygame.DROPFILE)
-        pygame.display.set_caption("Image Network Visualizer")
+        # Initialize pygame display. With use_gpu, frames are composited from
+        # textures by an SDL renderer instead of blitted in software
+        self.renderer = None
+        if use_gpu and Renderer is not None:
+            self.window = Window("Image Network Visualizer", size=(width, height), resizable=True)
+            try:
+                self.renderer = Renderer(self.window, accelerated=1, vsync=True)
+            except RendererError as e:
+                # No accelerated render driver; blit in software instead
+                print(f"GPU rendering unavailable ({e}), using software rendering")
+                self.window.destroy()
+        if self.renderer:
+            self.screen = None
+            self._textures = weakref.WeakKeyDictionary()
+        else:
+            self.screen = pygame.display.set_mode((width, height), pygame.RESIZABLE | pygame.DROPFILE)
+            pygame.display.set_caption("Image Network Visualizer")
+        # The mouse position is polled once per frame, so motion (and every
+        # other unhandled) event would only fill the queue
+        handled = [pygame.QUIT, pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.DROPFILE,
+                   pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.KEYDOWN]
+        if self.renderer:
+            handled.append(pygame.WINDOWSIZECHANGED)
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(handled)
         
         # Initialize core attributes
         self.nodes = []
+        self.clear_state()
         self.clock = pygame.time.Clock()
         self.selected_node = None
         self.hover_node = None
@@ -67,10 +565,31 @@ class NetworkVisualizer:
         self.repulsion = 300
         self.damping = 0.95
         self.max_velocity = 10
+        # Physics stops once no node moves more than this many pixels per
+        # frame
+        self.rest_speed = 0.01
+        # Nodes further apart than this don't repel each other
+        self.repulsion_cutoff = 8 * self.spring_length
+        # Above this many nodes repulsion uses the Barnes-Hut approximation.
+        # NumPy's exact pairwise sum keeps up with the tree walk until about
+        # 512 nodes; the compiled pairwise kernels (Numba, then Cython) stay
+        # faster than building the tree for much longer.
+        self.barnes_hut_threshold = 512
+        self.compiled_barnes_hut_threshold = 4096
+        self.cython_barnes_hut_threshold = 2048
+        self.theta = 0.9
         
         # UI parameters
         self.hover_scale = 1.3
         self.connection_radius = 60
+        # Spatial hash for hit testing; a cell is at least as wide as the
+        # largest node radius and the connection radius, so a 3x3 block
+        # covers a query
+        self.grid_cell = max(ImageNode.base_radius * self.hover_scale, self.connection_radius)
+        self._grid = None
+        # Up to this many nodes, hit tests check every node in one vectorized
+        # pass instead of building the spatial hash
+        self.grid_pick_threshold = 1024
         self.font = pygame.font.Font(None, 24)
         self.instructions = [
             "Drop image files to add them",
@@ -81,42 +600,147 @@ class NetworkVisualizer:
             "S to save, L to load",
             "Esc to quit"
         ]
+        self.instructions_rect = pygame.Rect(
+            10, 10, max(self.font.size(text)[0] for text in self.instructions),
+            25 * len(self.instructions))
+        # Rendered once; the text never changes
+        self._instructions_surf = self.render_instructions()
+        if self.renderer:
+            self._instructions_tex = Texture.from_surface(self.renderer, self._instructions_surf)
+        else:
+            self.render_background()
+
+        # Repaint only what changed since the previous frame, unless more than
+        # this fraction of the window changed
+        self.dirty_redraw_limit = 0.4
+        self._prev_node_rects = None
+        self._prev_segments = set()
+        self._pending_size = None
+
+    def clear_state(self):
+        self._buffers = {name: np.zeros(16, dtype=dtype) for name, dtype in self.state_arrays.items()}
+        self.resize_state(0)
+        # Connections as (i, j) node index pairs with i < j
+        self.edges = set()
+        self._grid = None
+        self._csr_dirty = True
+        # Nodes currently drawn at hover scale
+        self._hovered = []
+        self.wake()
+
+    def resize_state(self, n):
+        capacity = len(self._buffers["px"])
+        if n > capacity:
+            while n > capacity:
+                capacity *= 2
+            for name, buffer in self._buffers.items():
+                grown = np.zeros(capacity, dtype=buffer.dtype)
+                grown[:len(buffer)] = buffer
+                self._buffers[name] = grown
+        for name, buffer in self._buffers.items():
+            setattr(self, name, buffer[:n])
+
+    def update_csr(self):
+        # Topology changes only mark the CSR arrays stale; they're rebuilt
+        # once, when next needed, however many changes came in between
+        if self._csr_dirty:
+            self.rebuild_csr()
+            self._csr_dirty = False
+
+    def rebuild_csr(self):
+        # Connections as compressed sparse rows: node i's neighbours are
+        # colids[rowptr[i]:rowptr[i + 1]]
+        n = len(self.nodes)
+        pairs = np.array(sorted(self.edges), dtype=np.int32).reshape(-1, 2)
+        src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        self.rowptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=self.rowptr[1:])
+        self.colids = dst[np.argsort(src, kind="stable")]
+        if n < TINY_GRAPH:
+            self.adjacency = np.zeros((n, n), dtype=np.bool_)
+            self.adjacency[src, dst] = True
+        else:
+            self.adjacency = None
+        self._edge_paths = edge_paths(n, self.edges)
+        # The new paths can walk unchanged edges the other way, and a 2px
+        # line isn't the same pixels both ways, so repaint everything once
+        self._prev_node_rects = None
+        self._layer_segments = None
 
     def add_image(self, image_path, x=None, y=None):
         if x is None:
             x = random.randint(50, self.width - 50)
         if y is None:
             y = random.randint(50, self.height - 50)
-        node = ImageNode(image_path, x, y)
+        index = len(self.nodes)
+        node = ImageNode(image_path, self, index)
+        self.resize_state(index + 1)
+        self.px[index] = x
+        self.py[index] = y
+        self.vx[index] = self.vy[index] = 0
+        self.radii[index] = int(node.radius)
+        self.anchored[index] = False
         self.nodes.append(node)
+        self._grid = None
+        self._csr_dirty = True
+        self.wake()
         return node
 
     def remove_node(self, node):
         if node in self.nodes:
-            for other_node in self.nodes:
-                other_node.connections.discard(node)
-            self.nodes.remove(node)
+            if node in self._hovered:
+                self._hovered.remove(node)
+            # Move the last node into the freed slot
+            index = node.index
+            last = len(self.nodes) - 1
+            moved = self.nodes.pop()
+            if moved is not node:
+                self.nodes[index] = moved
+                moved.index = index
+            for name in self.state_arrays:
+                array = getattr(self, name)
+                array[index] = array[last]
+            self.resize_state(last)
+
+            edges = set()
+            for i, j in self.edges:
+                if index in (i, j):
+                    continue
+                i = index if i == last else i
+                j = index if j == last else j
+                edges.add((min(i, j), max(i, j)))
+            self.edges = edges
+            self._grid = None
+            self._csr_dirty = True
+            self.wake()
 
     def toggle_connection(self, node1, node2):
         if node1 != node2:
-            if node2 in node1.connections:
-                node1.connections.remove(node2)
-                node2.connections.remove(node1)
+            edge = (min(node1.index, node2.index), max(node1.index, node2.index))
+            if edge in self.edges:
+                self.edges.remove(edge)
             else:
-                node1.connections.add(node2)
-                node2.connections.add(node1)
+                self.edges.add(edge)
+            self._csr_dirty = True
+            self.wake()
 
     def save_state(self):
+        # Converted out of the arrays in one go rather than per node
+        self.update_csr()
+        xs, ys = self.px.tolist(), self.py.tolist()
+        anchored = self.anchored.tolist()
+        rowptr, colids = self.rowptr.tolist(), self.colids.tolist()
         data = {
             "nodes": [
                 {
                     "image_path": node.image_path,
-                    "x": node.x,
-                    "y": node.y,
-                    "anchored": node.anchored,
-                    "connections": [self.nodes.index(conn) for conn in node.connections]
+                    "x": xs[i],
+                    "y": ys[i],
+                    "anchored": anchored[i],
+                    "connections": colids[rowptr[i]:rowptr[i + 1]]
                 }
-                for node in self.nodes
+                for i, node in enumerate(self.nodes)
             ]
         }
         with open(self.save_file, "w") as f:
@@ -128,6 +752,10 @@ class NetworkVisualizer:
             with open(self.save_file, "r") as f:
                 data = json.load(f)
             self.nodes = []
+            self.clear_state()
+            # A node picked up before the load belongs to the old graph
+            self.selected_node = None
+            self.hover_node = None
             # Load nodes
             for node_data in data["nodes"]:
                 node = self.add_image(node_data["image_path"], node_data["x"], node_data["y"])
@@ -135,73 +763,369 @@ class NetworkVisualizer:
             # Load connections
             for i, node_data in enumerate(data["nodes"]):
                 for conn_index in node_data["connections"]:
-                    self.nodes[i].connections.add(self.nodes[conn_index])
+                    if conn_index != i:
+                        self.edges.add((min(i, conn_index), max(i, conn_index)))
+            self._csr_dirty = True
+            self.wake()
             print(f"State loaded from {self.save_file}")
         except FileNotFoundError:
             print(f"No save file found at {self.save_file}")
 
+    def spatial_grid(self):
+        # Node indices bucketed by cell, rebuilt lazily after the physics
+        # step moves nodes
+        if self._grid is None:
+            self._grid = {}
+            cells_x = (self.px // self.grid_cell).astype(int).tolist()
+            cells_y = (self.py // self.grid_cell).astype(int).tolist()
+            for i, cell in enumerate(zip(cells_x, cells_y)):
+                self._grid.setdefault(cell, []).append(i)
+        return self._grid
+
+    def grid_cell_of(self, index):
+        return (int(self.px[index] // self.grid_cell), int(self.py[index] // self.grid_cell))
+
+    def move_node(self, index, x, y):
+        # A single node moved (by dragging) is moved between cells rather
+        # than having the whole grid rebuilt
+        old = self.grid_cell_of(index) if self._grid is not None else None
+        self.wake()
+        self.px[index] = x
+        self.py[index] = y
+        if old is not None:
+            new = self.grid_cell_of(index)
+            if new != old:
+                self._grid[old].remove(index)
+                self._grid.setdefault(new, []).append(index)
+
+    def nodes_near(self, x, y):
+        # Indices, in list order, of the nodes in the 3x3 cells around (x, y)
+        grid = self.spatial_grid()
+        cell_x, cell_y = int(x // self.grid_cell), int(y // self.grid_cell)
+        near = []
+        for gx in (cell_x - 1, cell_x, cell_x + 1):
+            for gy in (cell_y - 1, cell_y, cell_y + 1):
+                near.extend(grid.get((gx, gy), ()))
+        return sorted(near)
+
+    def nodes_within(self, x, y, radius):
+        # Indices, in list order, of the nodes closer to (x, y) than radius,
+        # which is a single value or one per node
+        if len(self.nodes) > self.grid_pick_threshold:
+            candidates = np.array(self.nodes_near(x, y), dtype=np.intp)
+        else:
+            candidates = np.arange(len(self.nodes))
+        dx = self.px[candidates] - x
+        dy = self.py[candidates] - y
+        radius = np.asarray(radius, dtype=np.float32)
+        if radius.ndim:
+            radius = radius[candidates]
+        return candidates[dx * dx + dy * dy < radius * radius]
+
     def find_node_at_pos(self, x, y):
-        for node in self.nodes:
-            dx = x - node.x
-            dy = y - node.y
-            if math.sqrt(dx * dx + dy * dy) < node.radius:
-                return node
-        return None
+        hits = self.nodes_within(x, y, self.radii)
+        return self.nodes[hits[0]] if len(hits) else None
+
+    def repulsion_forces(self):
+        px, py = self.px, self.py
+        cutoff2 = self.repulsion_cutoff * self.repulsion_cutoff
+        if len(px) > self.barnes_hut_threshold:
+            return QuadTree(px, py).repulsion(px, py, self.repulsion, self.theta, cutoff2)
+
+        # Repulsion between every pair of nodes: dx[i, j] points from i to j.
+        # The (n, n) temporaries are reused in place and einsum sums each row
+        # without materializing dx * strength
+        dx = px[None, :] - px[:, None]
+        dy = py[None, :] - py[:, None]
+        d2 = dx * dx
+        d2 += dy * dy
+        # Pairs closer than a pixel (including each node and itself) or beyond
+        # the cutoff don't repel
+        d2[(d2 < 1.0) | (d2 > cutoff2)] = np.inf
+        strength = np.sqrt(d2)
+        strength *= d2
+        np.divide(self.repulsion, strength, out=strength)
+        fx = -np.einsum("ij,ij->i", dx, strength)
+        fy = -np.einsum("ij,ij->i", dy, strength)
+        return fx, fy
+
+    def wake(self):
+        # Something changed that can set nodes moving; step the physics
+        # until they settle again
+        self._resting = False
+        self._moved = np.inf
 
     def apply_forces(self):
-        # Skip physics if dragging a node
-        if self.selected_node:
+        # Skip physics if dragging a node, or while the graph is at rest
+        if self.selected_node or not self.nodes or self._resting:
+            return
+        old_x, old_y = self.px.copy(), self.py.copy()
+        self.step_physics()
+        # At rest once no node moved further than rest_speed in two steps
+        # running. This uses the distance moved rather than the velocity: a
+        # node pushed against a wall keeps bouncing in place with a nonzero
+        # velocity, but its position no longer changes.
+        moved = float(np.max((self.px - old_x) ** 2 + (self.py - old_y) ** 2))
+        limit = self.rest_speed * self.rest_speed
+        self._resting = moved < limit and self._moved < limit
+        self._moved = moved
+
+    def step_physics(self):
+        self._grid = None
+        self.update_csr()
+
+        if njit is not None:
+            n = len(self.nodes)
+            f32 = np.float32
+            spring = (f32(self.spring_length), f32(self.spring_strength))
+            motion = (f32(self.damping), f32(self.max_velocity), f32(self.width),
+                      f32(self.height), f32(self.padding))
+            if n > self.compiled_barnes_hut_threshold:
+                fx, fy = self.repulsion_forces()
+                _step_springs(self.px, self.py, self.vx, self.vy, self.anchored, self.rowptr,
+                              self.colids, fx, fy, *spring, *motion)
+                return
+            if n < TINY_GRAPH:
+                kernel, springs = step_kernel("tiny"), (self.adjacency,)
+            else:
+                kernel = step_kernel("small" if n < SMALL_GRAPH else "large")
+                springs = (self.rowptr, self.colids)
+            kernel(self.px, self.py, self.vx, self.vy, self.anchored, *springs, *spring,
+                   f32(self.repulsion), f32(self.repulsion_cutoff * self.repulsion_cutoff), *motion)
+            return
+
+        if forces is not None and len(self.nodes) <= self.cython_barnes_hut_threshold:
+            forces.step(self.px, self.py, self.vx, self.vy, self.anchored.view(np.uint8),
+                        self.rowptr, self.colids, self.spring_length, self.spring_strength,
+                        self.repulsion, self.repulsion_cutoff * self.repulsion_cutoff,
+                        self.damping, self.max_velocity, self.width, self.height, self.padding)
             return
 
-        for node in self.nodes:
+        px, py = self.px, self.py
+        fx, fy = self.repulsion_forces()
+
+        # Spring forces, one entry per directed connection
+        if len(self.colids):
+            src = np.repeat(np.arange(len(px)), np.diff(self.rowptr))
+            dst = self.colids
+            ex = px[dst] - px[src]
+            ey = py[dst] - py[src]
+            d2 = ex * ex + ey * ey
+            stretched = d2 > 0
+            inv_d = 1.0 / np.sqrt(d2[stretched])
+            spring = np.zeros_like(d2)
+            spring[stretched] = ((d2[stretched] * inv_d - self.spring_length)
+                                 * self.spring_strength * inv_d)
+            np.add.at(fx, src, ex * spring)
+            np.add.at(fy, src, ey * spring)
+
+        # Update velocity, limited to max_velocity
+        vx = (self.vx + fx) * self.damping
+        vy = (self.vy + fy) * self.damping
+        speed2 = vx * vx + vy * vy
+        fast = speed2 > self.max_velocity * self.max_velocity
+        if fast.any():
+            limit = self.max_velocity / np.sqrt(speed2[fast])
+            vx[fast] *= limit
+            vy[fast] *= limit
+
+        # Update position with boundary checking, bouncing off the walls and
+        # losing half the speed
+        x = px + vx
+        y = py + vy
+        low_x, high_x = x < self.padding, x > self.width - self.padding
+        low_y, high_y = y < self.padding, y > self.height - self.padding
+        x = np.where(low_x, self.padding, np.where(high_x, self.width - self.padding, x))
+        y = np.where(low_y, self.padding, np.where(high_y, self.height - self.padding, y))
+        vx = np.where(low_x | high_x, vx * -0.5, vx)
+        vy = np.where(low_y | high_y, vy * -0.5, vy)
+
+        free = ~self.anchored
+        self.vx[free] = vx[free]
+        self.vy[free] = vy[free]
+        self.px[free] = x[free]
+        self.py[free] = y[free]
+
+    def blit_all(self, blits, special_flags=0):
+        # pygame-ce's fblits doesn't build the list of changed rects
+        if hasattr(self.screen, "fblits"):
+            self.screen.fblits(blits, special_flags)
+        else:
+            if special_flags:
+                blits = [(surface, pos, None, special_flags) for surface, pos in blits]
+            self.screen.blits(blits, doreturn=False)
+
+    def collect_sprites(self):
+        # Build this frame's blit lists and edge segments, and record the
+        # area, look and draw position of every node so the next frame can
+        # tell what changed
+        self.update_csr()
+        self._bg_blits = []
+        self._img_blits = []
+        self._ring_blits = []
+        self._segments = set()
+        self._node_rects = {}
+        xs = self.px.astype(int)
+        ys = self.py.astype(int)
+        self._points = list(zip(xs.tolist(), ys.tolist()))
+
+        # Only nodes that overlap the window get blitted
+        margin = self.radii + 3
+        visible = ((xs > -margin) & (xs < self.width + margin)
+                   & (ys > -margin) & (ys < self.height + margin))
+        for i in np.flatnonzero(visible).tolist():
+            node = self.nodes[i]
+            x, y = self._points[i]
+            r = int(node.radius)
+            self._bg_blits.append((node.bg_surf, (x - r, y - r)))
+            self._img_blits.append((node.image, (x - node._half_w, y - node._half_h)))
+            selected = node == self.selected_node
             if node.anchored:
-                continue
+                self._ring_blits.append((node.anchor_ring, (x - r - 2, y - r - 2)))
+            if selected:
+                self._ring_blits.append((node.select_ring, (x - r - 2, y - r - 2)))
+            self._node_rects[node] = ((x - r - 3, y - r - 3, 2 * r + 7, 2 * r + 7),
+                                      node.image, node.anchored, selected, i)
+        for i, j in self.edges:
+            start, end = self._points[i], self._points[j]
+            self._segments.add((start, end) if start <= end else (end, start))
 
-            fx = fy = 0
+    def dirty_rects(self):
+        # Old and new areas of every node or edge that changed since last frame
+        dirty = []
+        for node, state in self._node_rects.items():
+            prev = self._prev_node_rects.get(node)
+            if prev != state:
+                dirty.append(state[0])
+                if prev:
+                    dirty.append(prev[0])
+        for node, prev in self._prev_node_rects.items():
+            if node not in self._node_rects:
+                dirty.append(prev[0])
+        for segment in self._segments ^ self._prev_segments:
+            dirty.append(segment_rect(segment))
+        dirty = merge_rects(dirty)
+        screen_rect = self.screen.get_rect()
+        return [rect for rect in dirty if rect.clip(screen_rect).size != (0, 0)]
 
-            # Apply spring forces from connections
-            for connected_node in node.connections:
-                dx = connected_node.x - node.x
-                dy = connected_node.y - node.y
-                distance = math.sqrt(dx * dx + dy * dy)
-                if distance == 0:
-                    continue
-                force = (distance - self.spring_length) * self.spring_strength
-                fx += (dx / distance) * force
-                fy += (dy / distance) * force
-
-            # Apply repulsion forces from other nodes
-            for other_node in self.nodes:
-                if other_node != node:
-                    dx = other_node.x - node.x
-                    dy = other_node.y - node.y
-                    distance = math.sqrt(dx * dx + dy * dy)
-                    if distance < 1:
-                        continue
-                    force = self.repulsion / (distance * distance)
-                    fx -= (dx / distance) * force
-                    fy -= (dy / distance) * force
-
-            # Update velocity and position
-            node.vx = (node.vx + fx) * self.damping
-            node.vy = (node.vy + fy) * self.damping
-
-            # Limit velocity
-            speed = math.sqrt(node.vx * node.vx + node.vy * node.vy)
-            if speed > self.max_velocity:
-                node.vx = (node.vx / speed) * self.max_velocity
-                node.vy = (node.vy / speed) * self.max_velocity
-
-            # Update position with boundary checking
-            node.x = max(self.padding, min(self.width - self.padding, node.x + node.vx))
-            node.y = max(self.padding, min(self.height - self.padding, node.y + node.vy))
-
-    def draw_instructions(self):
-        y = 10
+    def render_background(self):
+        # Everything that doesn't move: the white fill with the instructions
+        # on it. Repainting an area starts by copying it from here.
+        self.background = pygame.Surface((self.width, self.height)).convert()
+        self.background.fill((255, 255, 255))
+        self.background.blit(self._instructions_surf, self.instructions_rect)
+        self._edge_layer = self.background.copy()
+        self._layer_segments = None
+
+    def edge_layer(self):
+        # The background with the edges drawn on it, redrawn only when an
+        # edge moved or the graph changed. Partial repaints copy from it, so
+        # edges are never rasterized clipped.
+        if self._layer_segments != self._segments:
+            self._edge_layer.blit(self.background, (0, 0))
+            self.draw_edges(self._edge_layer)
+            self._layer_segments = self._segments
+        return self._edge_layer
+
+    def draw_edges(self, surface):
+        points = self._points
+        for path in self._edge_paths:
+            pygame.draw.lines(surface, (200, 200, 200), False, [points[i] for i in path], 2)
+
+    def draw_scene(self):
+        # Draws within the screen's clip rect
+        self.screen.blit(self.background, (0, 0))
+        self.draw_edges(self.screen)
+        self.draw_nodes()
+
+    def texture(self, surface):
+        # Uploaded once per surface. Keyed weakly, so a node image's texture
+        # goes once no node shows that image; the circle sprites are cached
+        # for good and so are their textures.
+        texture = self._textures.get(surface)
+        if texture is None:
+            texture = self._textures[surface] = Texture.from_surface(self.renderer, surface)
+        return texture
+
+    def draw_frame(self):
+        self.collect_sprites()
+        if self.renderer:
+            self.draw_frame_gpu()
+            return
+        if self._prev_node_rects is None:
+            dirty = None
+        else:
+            dirty = self.dirty_rects()
+            if sum(rect.w * rect.h for rect in dirty) > self.dirty_redraw_limit * self.width * self.height:
+                dirty = None
+        self._prev_node_rects = self._node_rects
+        self._prev_segments = self._segments
+
+        if dirty is None:
+            self.draw_scene()
+            pygame.display.flip()
+        elif dirty:
+            layer = self.edge_layer()
+            for rect in dirty:
+                self.screen.set_clip(rect)
+                self.screen.blit(layer, rect, rect)
+                self.draw_nodes()
+            self.screen.set_clip(None)
+            pygame.display.update(dirty)
+
+    def draw_nodes(self):
+        # Backgrounds, images and rings are each drawn with a single batched call
+        self.blit_all(self._bg_blits)
+        self.blit_all(self._img_blits, pygame.BLEND_PREMULTIPLIED)
+        self.blit_all(self._ring_blits)
+
+    def draw_frame_gpu(self):
+        # The whole frame is recomposited every time; each sprite is one
+        # textured draw call
+        renderer = self.renderer
+        renderer.draw_color = (255, 255, 255, 255)
+        renderer.clear()
+        self._instructions_tex.draw(dstrect=self.instructions_rect.topleft)
+        renderer.draw_color = (200, 200, 200, 255)
+        points = self._points
+        for i, j in self.edges:
+            (x1, y1), (x2, y2) = points[i], points[j]
+            # Renderer lines are a pixel wide, so draw a second one next to it
+            ox, oy = (0, 1) if abs(x2 - x1) > abs(y2 - y1) else (1, 0)
+            renderer.draw_line((x1, y1), (x2, y2))
+            renderer.draw_line((x1 + ox, y1 + oy), (x2 + ox, y2 + oy))
+        for blits in (self._bg_blits, self._img_blits, self._ring_blits):
+            for surface, pos in blits:
+                self.texture(surface).draw(dstrect=pos)
+        renderer.present()
+
+    def render_instructions(self):
+        # The text on the window's white background
+        surface = pygame.Surface(self.instructions_rect.size)
+        surface.fill((255, 255, 255))
+        y = 0
         for instruction in self.instructions:
-            text = self.font.render(instruction, True, (100, 100, 100))
-            self.screen.blit(text, (10, y))
+            surface.blit(self.font.render(instruction, True, (100, 100, 100)), (0, y))
             y += 25
+        return surface
+
+    def resize(self, width, height):
+        width = max(width, self.min_window_size[0])
+        height = max(height, self.min_window_size[1])
+        self.width = width
+        self.height = height
+        self.wake()
+        if self.renderer:
+            if self.window.size != (width, height):
+                self.window.size = (width, height)
+        else:
+            # pygame resizes the display surface along with the window, so
+            # set_mode is only needed to enforce the minimum size
+            if self.screen.get_size() != (width, height):
+                self.screen = pygame.display.set_mode((width, height), pygame.RESIZABLE | pygame.DROPFILE)
+            if self.background.get_size() != (width, height):
+                self.render_background()
+            self._prev_node_rects = None
 
     def run(self):
         running = True
@@ -212,11 +1136,14 @@ class NetworkVisualizer:
                 if event.type == pygame.QUIT:
                     running = False
                 elif event.type == pygame.VIDEORESIZE:
-                    width = max(event.w, self.min_window_size[0])
-                    height = max(event.h, self.min_window_size[1])
-                    self.width = width
-                    self.height = height
-                    self.screen = pygame.display.set_mode((width, height), pygame.RESIZABLE | pygame.DROPFILE)
+                    # Dragging a window edge sends a stream of these; only
+                    # the last one each frame is acted on
+                    self._pending_size = (event.w, event.h)
+                elif event.type == pygame.WINDOWSIZECHANGED and self.renderer:
+                    # The renderer's window doesn't send VIDEORESIZE
+                    self._pending_size = (event.x, event.y)
+                elif event.type == pygame.VIDEOEXPOSE:
+                    self._prev_node_rects = None
                 elif event.type == pygame.DROPFILE:
                     image_path = event.file
                     self.add_image(image_path, mouse_x, mouse_y)
@@ -241,10 +1168,13 @@ class NetworkVisualizer:
                     elif event.key == pygame.K_ESCAPE:
                         running = False
 
+            if self._pending_size:
+                self.resize(*self._pending_size)
+                self._pending_size = None
+
             # Reset hover states
             self.hover_node = None
-            for node in self.nodes:
-                node.set_hover_scale(1.0)
+            hovered = []
 
             # Handle selected node
             if self.selected_node:
@@ -252,47 +1182,28 @@ class NetworkVisualizer:
                 self.selected_node.vx = self.selected_node.vy = 0
                 
                 # Check for potential connections
-                for node in self.nodes:
+                for i in self.nodes_within(mouse_x, mouse_y, self.connection_radius).tolist():
+                    node = self.nodes[i]
                     if node != self.selected_node:
-                        dx = mouse_x - node.x
-                        dy = mouse_y - node.y
-                        if math.sqrt(dx * dx + dy * dy) < self.connection_radius:
-                            self.hover_node = node
-                            node.set_hover_scale(self.hover_scale)
-                            self.selected_node.set_hover_scale(self.hover_scale)
-                            break
+                        self.hover_node = node
+                        hovered = [node, self.selected_node]
+                        break
+
+            # Only the nodes enlarged last frame can need shrinking back
+            for node in self._hovered:
+                if node not in hovered:
+                    node.set_hover_scale(1.0)
+            for node in hovered:
+                node.set_hover_scale(self.hover_scale)
+            self._hovered = hovered
 
             # Update physics and draw
             self.apply_forces()
-            self.screen.fill((255, 255, 255))
-
-            # Draw connections
-            for node in self.nodes:
-                for connected_node in node.connections:
-                    pygame.draw.line(self.screen, (200, 200, 200), 
-                                  (int(node.x), int(node.y)), 
-                                  (int(connected_node.x), int(connected_node.y)), 2)
-
-            # Draw nodes
-            for node in self.nodes:
-                pygame.draw.circle(self.screen, (240, 240, 240), 
-                                (int(node.x), int(node.y)), int(node.radius))
-                image_rect = node.image.get_rect(center=(int(node.x), int(node.y)))
-                self.screen.blit(node.image, image_rect)
-                
-                if node.anchored:
-                    pygame.draw.circle(self.screen, (0, 120, 255), 
-                                    (int(node.x), int(node.y)), int(node.radius + 2), 3)
-                if node == self.selected_node:
-                    pygame.draw.circle(self.screen, (0, 255, 0), 
-                                    (int(node.x), int(node.y)), int(node.radius + 2), 2)
-
-            self.draw_instructions()
-            pygame.display.flip()
+            self.draw_frame()
             self.clock.tick(60)
 
         pygame.quit()
 
 if __name__ == "__main__":
-    visualizer = NetworkVisualizer()
+    visualizer = NetworkVisualizer(use_gpu="--gpu" in sys.argv[1:])
     visualizer.run()
\ No newline at end of file
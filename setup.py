@@ -0,0 +1,5 @@
+# Builds the optional Cython physics step: python setup.py build_ext --inplace
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(name="forces", ext_modules=cythonize("forces.pyx"))